@@ -1,68 +1,89 @@
 """Generate a small flights dataset that will work with our federated query demo."""
 
-import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 def generate_flights_data():
     """Generate flight data that matches our test weather and airports data."""
-    
+
     # Create date range matching our weather data
-    dates = pd.date_range('2015-01-01', '2015-12-31', freq='D')
-    
+    dates = np.arange('2015-01-01', '2016-01-01', dtype='datetime64[D]')
+
     # Airport codes from our test data
-    airport_codes = ['ATL', 'DFW', 'DEN', 'ORD', 'LAX', 'CLT', 'LAS', 'PHX', 'MCO', 'SEA']
-    
-    # Generate flights for each airport pair each day
-    rows = []
-    for date in dates:
-        # Create multiple flights between different airport pairs
-        for origin in airport_codes:
-            # Each airport has flights to 3 random destinations per day
-            destinations = np.random.choice(
-                [code for code in airport_codes if code != origin],
-                size=3,
-                replace=False
-            )
-            for dest in destinations:
-                # Create 2 flights for each route per day
-                for _ in range(2):
-                    # Generate realistic flight data
-                    air_time = np.random.normal(120, 30)  # ~2 hours average flight
-                    dep_time = np.random.randint(6, 22)  # Flights between 6 AM and 10 PM
-                    dep_delay = np.random.normal(15, 10)  # Average 15 min delay
-                    
-                    rows.append({
-                        'FL_DATE': date,
-                        'ORIGIN': origin,
-                        'DEST': dest,
-                        'DEP_TIME': float(dep_time * 100),  # Convert to HHMM format
-                        'DEP_DELAY': int(dep_delay),
-                        'AIR_TIME': int(max(30, air_time)),  # Ensure positive air time
-                        'DISTANCE': int(np.random.normal(800, 200))  # Average flight distance
-                    })
-    
-    # Create DataFrame
-    flights_df = pd.DataFrame(rows)
-    
-    # Save to parquet
+    airport_codes = np.array(['ATL', 'DFW', 'DEN', 'ORD', 'LAX', 'CLT', 'LAS', 'PHX', 'MCO', 'SEA'])
+
+    # Each airport has flights to 3 random destinations per day, 2 flights per route
+    routes_per_origin = 3
+    flights_per_route = 2
+    n_airports = len(airport_codes)
+    n_groups = len(dates) * n_airports
+    n_rows = n_groups * routes_per_origin * flights_per_route
+    rng = np.random.default_rng()
+
+    # One (date, origin) group per row of the destination matrix
+    origin_idx = np.tile(np.arange(n_airports), len(dates))
+
+    # Pick 3 distinct destinations out of the other 9 airports, then shift the
+    # picks past the origin's own index so an airport never flies to itself
+    picks = rng.permuted(
+        np.tile(np.arange(n_airports - 1), (n_groups, 1)), axis=1
+    )[:, :routes_per_origin]
+    dest_idx = picks + (picks >= origin_idx[:, None])
+
+    # Expand groups to one entry per flight
+    rows_per_group = routes_per_origin * flights_per_route
+    fl_date = np.repeat(dates, n_airports * rows_per_group)
+    origin_idx = np.repeat(origin_idx, rows_per_group).astype(np.int8)
+    dest_idx = np.repeat(dest_idx.ravel(), flights_per_route).astype(np.int8)
+
+    # Generate realistic flight data for all rows at once
+    air_time = rng.normal(120, 30, n_rows)  # ~2 hours average flight
+    dep_time = rng.integers(6, 22, n_rows)  # Flights between 6 AM and 10 PM
+    dep_delay = rng.normal(15, 10, n_rows)  # Average 15 min delay
+    distance = rng.normal(800, 200, n_rows)  # Average flight distance
+
+    # Build the Arrow table straight from the column arrays; ORIGIN/DEST are
+    # dictionary-encoded against the airport codes
+    airports = pa.array(airport_codes)
+    flights = pa.table({
+        'FL_DATE': pa.array(fl_date, type=pa.date32()),
+        'ORIGIN': pa.DictionaryArray.from_arrays(origin_idx, airports),
+        'DEST': pa.DictionaryArray.from_arrays(dest_idx, airports),
+        'DEP_TIME': (dep_time * 100).astype(np.float64),  # Convert to HHMM format
+        'DEP_DELAY': dep_delay.astype(np.int64),
+        'AIR_TIME': np.maximum(30, air_time).astype(np.int64),  # Ensure positive air time
+        'DISTANCE': distance.astype(np.int64),
+    })
+
+    # Save to parquet; row groups match DuckDB's 122,880-row row group size
     output_path = 'flights_small.parquet'
-    flights_df.to_parquet(output_path, index=False)
-    
+    pq.write_table(
+        flights,
+        output_path,
+        compression='zstd',
+        use_dictionary=True,
+        row_group_size=122880,
+    )
+
     # Print summary
-    print(f"Generated {len(flights_df):,} rows of flight data")
-    print(f"Date range: {flights_df['FL_DATE'].min()} to {flights_df['FL_DATE'].max()}")
-    print(f"Origins: {', '.join(sorted(flights_df['ORIGIN'].unique()))}")
-    print(f"Destinations: {', '.join(sorted(flights_df['DEST'].unique()))}")
+    date_range = pc.min_max(flights['FL_DATE'])
+    print(f"Generated {flights.num_rows:,} rows of flight data")
+    print(f"Date range: {date_range['min']} to {date_range['max']}")
+    print(f"Origins: {', '.join(sorted(pc.unique(flights['ORIGIN'].cast(pa.string())).to_pylist()))}")
+    print(f"Destinations: {', '.join(sorted(pc.unique(flights['DEST'].cast(pa.string())).to_pylist()))}")
     print(f"Saved to: {output_path}")
-    
+
     # Show sample
     print("\nSample data:")
-    print(flights_df.head())
-    
+    for row in flights.slice(0, 5).to_pylist():
+        print(row)
+
     # Show schema
     print("\nSchema:")
-    for col, dtype in flights_df.dtypes.items():
-        print(f"{col}: {dtype}")
+    for field in flights.schema:
+        print(f"{field.name}: {field.type}")
 
 if __name__ == "__main__":
-    generate_flights_data() 
\ No newline at end of file
+    generate_flights_data()
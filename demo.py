@@ -1,26 +1,43 @@
 import time
+import functools
+import heapq
+import io
+import json
 import logging
 import os
 import signal
+import socket
 import sys
-import warnings
-from typing import Dict, List, Optional, Tuple, Any
+import tempfile
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Any, Union
 
 import duckdb
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import pyarrow.flight as flight
 from pyarrow.flight import FlightDescriptor, Ticket
 from cloudpickle import dumps
 
-# Filter out Arrow alignment warnings
-warnings.filterwarnings("ignore", message="An input buffer was poorly aligned")
-
 # Import core types from the Flight server module
 from flight_server import (
     AbstractExchanger,
     AddExchangeAction,
+    all_true_array,
+    processed_schema,
+    PROCESSED_FIELD,
+    write_options_for,
+    is_loopback_location,
+    LOCAL_WRITE_OPTIONS,
+    REMOTE_WRITE_OPTIONS,
+    EXCHANGER_REGISTRY,
     FlightServerManager,
     FlightServerConfig,
+    PullFromAction,
 )
 
 # ------------------------------------------------------------------------------
@@ -48,9 +65,73 @@ class ClientConfig:
         return f"ClientConfig(name={self.name}, location={self.location})"
 
 
+# Target size of batches cut from in-memory tables: large enough that per-batch
+# framing and Python calls are amortized, with no measurable gain beyond it
+TARGET_BATCH_BYTES = 1024 * 1024
+
+# Floor on rows per batch, whatever the row width
+MIN_BATCH_ROWS = 1024
+
+# gRPC channel arguments shared by every Flight client; lift the default message
+# size caps so large record batches travel as single messages, give each
+# client its own subchannel so pooled clients open separate TCP connections,
+# allow the largest HTTP/2 frame (2^24 - 1) so batches are split into fewer
+# frames, and never send keepalive pings on the (plaintext, local) channels
+CLIENT_GENERIC_OPTIONS = [
+    ("grpc.max_receive_message_length", -1),
+    ("grpc.max_send_message_length", -1),
+    ("grpc.use_local_subchannel_pool", 1),
+    ("grpc.http2.max_frame_size", (1 << 24) - 1),
+    ("grpc.keepalive_time_ms", 2**31 - 1),
+]
+
+# Clients opened per server; calls are spread across them round-robin
+CLIENT_POOL_SIZE = 4
+
+# Most parallel reads transfer_table splits a source table into: one per pooled
+# client, but no more than there are cores to decode them
+TRANSFER_STREAMS = min(CLIENT_POOL_SIZE, os.cpu_count() or 1)
+
+# Fewest rows worth a read of their own; smaller tables and views travel whole
+MIN_STREAM_ROWS = 1 << 20
+
+# Call options for uploads, with the server's IPC options for local and remote
+# streams
+WRITE_CALL_OPTIONS = flight.FlightCallOptions(write_options=LOCAL_WRITE_OPTIONS)
+REMOTE_WRITE_CALL_OPTIONS = flight.FlightCallOptions(write_options=REMOTE_WRITE_OPTIONS)
+
+# Action types that never change, encoded once instead of on every call
+ADD_EXCHANGE_ACTION_TYPE = AddExchangeAction.name.encode("utf-8")
+PULL_FROM_ACTION_TYPE = PullFromAction.name.encode("utf-8")
+
+
+def _demo_location(port: int) -> str:
+    """Location for a demo server running on this machine.
+
+    Where Unix domain sockets exist, the server listens on a socket file named
+    after its port instead, which skips the loopback TCP stack.
+    """
+    if hasattr(socket, "AF_UNIX"):
+        path = os.path.join(tempfile.gettempdir(), f"mallard.{port}.sock")
+        return f"grpc+unix://{path}"
+    return f"grpc://localhost:{port}"
+
+
+SERVER1_LOCATION = _demo_location(8815)
+SERVER2_LOCATION = _demo_location(8816)
+
 # Default client configurations for two servers
-SERVER1_CONFIG = ClientConfig(location="grpc://localhost:8815", name="server1")
-SERVER2_CONFIG = ClientConfig(location="grpc://localhost:8816", name="server2")
+SERVER1_CONFIG = ClientConfig(location=SERVER1_LOCATION, name="server1")
+SERVER2_CONFIG = ClientConfig(location=SERVER2_LOCATION, name="server2")
+
+
+class _ClientSlot:
+    """A thread's index into every client pool."""
+
+    __slots__ = ("index", "__weakref__")
+
+    def __init__(self, index: int):
+        self.index = index
 
 
 class FlightClientManager:
@@ -59,16 +140,35 @@ class FlightClientManager:
     This class is responsible solely for connecting and disconnecting clients.
     """
 
-    def __init__(self, configs: Optional[List[ClientConfig]] = None):
+    def __init__(
+        self,
+        configs: Optional[List[ClientConfig]] = None,
+        pool_size: int = CLIENT_POOL_SIZE,
+    ):
         self.configs = configs or [SERVER1_CONFIG, SERVER2_CONFIG]
-        self.clients: Dict[str, flight.FlightClient] = {}
+        self.pool_size = pool_size
+        self.clients: Dict[str, List[flight.FlightClient]] = {}
+        # Pool slots held by live threads; a thread's slot is handed back when
+        # it exits, and new threads take the lowest free one
+        self._thread_slot = threading.local()
+        self._free_slots: List[int] = []
+        self._slots_issued = 0
+        self._slot_lock = threading.Lock()
         self._connect_all()
 
     def _connect_all(self):
         for config in self.configs:
             try:
-                self.clients[config.name] = flight.connect(config.location)
-                logger.info(f"Connected to {config.name} at {config.location}")
+                self.clients[config.name] = [
+                    flight.connect(
+                        config.location, generic_options=CLIENT_GENERIC_OPTIONS
+                    )
+                    for _ in range(self.pool_size)
+                ]
+                logger.info(
+                    f"Connected to {config.name} at {config.location} "
+                    f"with {self.pool_size} clients"
+                )
             except Exception as e:
                 logger.error(f"Failed to connect to {config.name}: {e}")
                 raise
@@ -76,12 +176,47 @@ class FlightClientManager:
     def get_client(self, name: str) -> flight.FlightClient:
         if name not in self.clients:
             raise ValueError(f"Unknown client: {name}")
-        return self.clients[name]
+        pool = self.clients[name]
+        # Each thread keeps one slot in every pool, so threads alive at the
+        # same time, up to pool_size of them, use connections of their own
+        slot = getattr(self._thread_slot, "value", None)
+        if slot is None:
+            slot = self._thread_slot.value = self._acquire_slot()
+        return pool[slot.index % len(pool)]
+
+    def _acquire_slot(self) -> "_ClientSlot":
+        with self._slot_lock:
+            if self._free_slots:
+                index = heapq.heappop(self._free_slots)
+            else:
+                index = self._slots_issued
+                self._slots_issued += 1
+        slot = _ClientSlot(index)
+        # Thread-local values are dropped when their thread exits
+        weakref.finalize(slot, self._release_slot, index)
+        return slot
+
+    def _release_slot(self, index: int):
+        with self._slot_lock:
+            heapq.heappush(self._free_slots, index)
+
+    def get_location(self, name: str) -> str:
+        for config in self.configs:
+            if config.name == name:
+                return config.location
+        raise ValueError(f"Unknown client: {name}")
+
+    def get_write_options(self, name: str) -> flight.FlightCallOptions:
+        """Upload call options for a server, compressed unless it is local."""
+        if is_loopback_location(self.get_location(name)):
+            return WRITE_CALL_OPTIONS
+        return REMOTE_WRITE_CALL_OPTIONS
 
     def close_all(self):
-        for name, client in self.clients.items():
+        for name, pool in self.clients.items():
             try:
-                client.close()
+                for client in pool:
+                    client.close()
                 logger.info(f"Closed connection to {name}")
             except Exception as e:
                 logger.error(f"Error closing connection to {name}: {e}")
@@ -91,6 +226,25 @@ class FlightClientManager:
 # ------------------------------------------------------------------------------
 # Data Operations (Client-Side)
 # ------------------------------------------------------------------------------
+@functools.lru_cache(maxsize=256)
+def _ticket(query: str) -> Ticket:
+    """Returns a cached Ticket for a SQL query."""
+    return Ticket(query.encode("utf-8"))
+
+
+@functools.lru_cache(maxsize=256)
+def _command_descriptor(command: str) -> FlightDescriptor:
+    """Returns a cached command descriptor for a table name or exchange command."""
+    return FlightDescriptor.for_command(command.encode("utf-8"))
+
+
+def _rows_per_batch(table: pa.Table, target_bytes: int = TARGET_BATCH_BYTES) -> int:
+    """Returns how many rows of the table fit in roughly target_bytes."""
+    row_bytes = max(1, table.nbytes // max(1, table.num_rows))
+    # Very wide rows still get batches big enough to amortize per-call overhead
+    return max(MIN_BATCH_ROWS, target_bytes // row_bytes)
+
+
 class DataOperations:
     """
     Provides methods for executing queries, transferring data, and performing exchanges.
@@ -100,84 +254,259 @@ class DataOperations:
     def __init__(self, client_manager: FlightClientManager):
         self.client_manager = client_manager
 
-    def execute_query(self, server_name: str, query: str) -> pa.Table:
+    def execute_query(self, server_name: str, query: Union[str, Ticket]) -> pa.Table:
         client = self.client_manager.get_client(server_name)
-        reader = client.do_get(Ticket(query.encode("utf-8")))
+        ticket = query if isinstance(query, Ticket) else _ticket(query)
+        reader = client.do_get(ticket)
         return reader.read_all()
 
-    def create_table(self, server_name: str, table_name: str, data: pa.Table):
+    def stream_query(
+        self, server_name: str, query: Union[str, Ticket]
+    ) -> pa.RecordBatchReader:
+        """Runs a query and returns a reader that yields batches as they arrive."""
+        client = self.client_manager.get_client(server_name)
+        ticket = query if isinstance(query, Ticket) else _ticket(query)
+        return client.do_get(ticket).to_reader()
+
+    def create_table(
+        self,
+        server_name: str,
+        table_name: str,
+        data: Union[pa.Table, pa.RecordBatchReader],
+    ):
         client = self.client_manager.get_client(server_name)
-        descriptor = FlightDescriptor.for_command(table_name.encode())
-        writer, _ = client.do_put(descriptor, data.schema)
-        for batch in data.to_batches():
-            writer.write_batch(batch)
+        descriptor = _command_descriptor(table_name)
+        options = self.client_manager.get_write_options(server_name)
+        writer, _ = client.do_put(descriptor, data.schema, options=options)
+        if isinstance(data, pa.RecordBatchReader):
+            # Readers are forwarded as they are produced, never held in memory
+            total_rows = 0
+            for batch in data:
+                writer.write_batch(batch)
+                total_rows += batch.num_rows
+        else:
+            writer.write_table(data, max_chunksize=_rows_per_batch(data))
+            total_rows = data.num_rows
         writer.close()
         logger.info(
-            f"Created table {table_name} on {server_name} with {data.num_rows} rows"
+            f"Created table {table_name} on {server_name} with {total_rows} rows"
         )
 
     def register_exchanger(self, server_name: str, exchanger_class):
         client = self.client_manager.get_client(server_name)
-        serialized_exchanger = dumps(exchanger_class)
-        action = flight.Action(AddExchangeAction.name, serialized_exchanger)
-        result = list(client.do_action(action))
+        if EXCHANGER_REGISTRY.get(exchanger_class.command) is exchanger_class:
+            # The server already has this class; just name it
+            result = self._add_exchange(client, exchanger_class.command)
+        else:
+            # Classes the server does not know are shipped pickled
+            result = self._add_exchange(client, dumps(exchanger_class))
         logger.info(f"Registered exchanger {exchanger_class.__name__} on {server_name}")
         return result
 
+    @staticmethod
+    def _add_exchange(client: flight.FlightClient, payload: Union[str, bytes]):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        action = flight.Action(ADD_EXCHANGE_ACTION_TYPE, payload)
+        return list(client.do_action(action))
+
     def transfer_table(
+        self,
+        from_server: str,
+        to_server: str,
+        table_name: str,
+        streams: int = TRANSFER_STREAMS,
+    ) -> Tuple[int, float]:
+        start_time = time.time()
+        queries = self._transfer_queries(from_server, table_name, streams)
+        # Ranges are read concurrently, then sent in order as one upload, so
+        # the destination keeps the source's row order and a failed read
+        # leaves it untouched
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            tables = list(
+                executor.map(
+                    lambda query: self.execute_query(from_server, _ticket(query)),
+                    queries,
+                )
+            )
+        table = pa.concat_tables(tables)
+        dest_client = self.client_manager.get_client(to_server)
+        writer, _ = dest_client.do_put(
+            _command_descriptor(table_name),
+            table.schema,
+            options=self.client_manager.get_write_options(to_server),
+        )
+        writer.write_table(table, max_chunksize=_rows_per_batch(table))
+        writer.close()
+        duration = time.time() - start_time
+        logger.info(
+            f"Transferred {table.num_rows} rows over {len(queries)} streams "
+            f"in {duration*1000:.2f} ms"
+        )
+        return table.num_rows, duration
+
+    def _transfer_queries(
+        self, from_server: str, table_name: str, streams: int
+    ) -> List[str]:
+        """Queries that together read the whole table, in row order.
+
+        Only base tables large enough are split, into contiguous rowid ranges;
+        views have no rowid and are always read whole.
+        """
+        whole = [f"SELECT * FROM {table_name}"]
+        if streams <= 1:
+            return whole
+        sizes = self.execute_query(
+            from_server,
+            "SELECT estimated_size FROM duckdb_tables() "
+            f"WHERE table_name = '{table_name}'",
+        ).column(0)
+        rows = sizes[0].as_py() if len(sizes) else 0
+        streams = min(streams, rows // MIN_STREAM_ROWS)
+        if streams <= 1:
+            return whole
+        step = -(-rows // streams)
+        bounds = [i * step for i in range(1, streams)]
+        # The open-ended first and last ranges cover rowids past the estimate
+        queries = [f"{whole[0]} WHERE rowid < {bounds[0]}"]
+        queries += [
+            f"{whole[0]} WHERE rowid >= {lo} AND rowid < {hi}"
+            for lo, hi in zip(bounds, bounds[1:])
+        ]
+        queries.append(f"{whole[0]} WHERE rowid >= {bounds[-1]}")
+        return queries
+
+    def pull_table(
         self, from_server: str, to_server: str, table_name: str
     ) -> Tuple[int, float]:
-        source_client = self.client_manager.get_client(from_server)
-        reader = source_client.do_get(Ticket(f"SELECT * FROM {table_name}".encode()))
-        schema = reader.schema
+        """Has to_server fetch the table from from_server directly.
+
+        Unlike transfer_table, the rows cross the wire once and never pass
+        through this process.
+        """
         dest_client = self.client_manager.get_client(to_server)
-        descriptor = FlightDescriptor.for_command(table_name.encode())
-        writer, _ = dest_client.do_put(descriptor, schema)
+        body = json.dumps(
+            {
+                "location": self.client_manager.get_location(from_server),
+                "table": table_name,
+            }
+        ).encode("utf-8")
         start_time = time.time()
-        total_rows = 0
-        batch_count = 0
-        for chunk in reader:
-            batch = chunk.data
-            if batch.num_rows == 0:
-                continue
-            writer.write_batch(batch)
-            batch_count += 1
-            total_rows += batch.num_rows
-        writer.close()
+        results = list(
+            dest_client.do_action(flight.Action(PULL_FROM_ACTION_TYPE, body))
+        )
         duration = time.time() - start_time
+        total_rows = int(results[0].body.to_pybytes())
         logger.info(
-            f"Transferred {total_rows} rows in {batch_count} batches in {duration*1000:.2f} ms"
+            f"{to_server} pulled {total_rows} rows of {table_name} from "
+            f"{from_server} in {duration*1000:.2f} ms"
         )
         return total_rows, duration
 
-    def exchange_data(self, server_name: str, command: str, data: pa.Table) -> pa.Table:
+    def exchange_batches(
+        self, server_name: str, command: str, data: pa.Table
+    ) -> Iterator[pa.RecordBatch]:
+        """Sends data through an exchange and yields result batches as they arrive."""
         client = self.client_manager.get_client(server_name)
-        descriptor = FlightDescriptor.for_command(command.encode())
-        writer, reader = client.do_exchange(descriptor)
+        descriptor = _command_descriptor(command)
+        options = self.client_manager.get_write_options(server_name)
+        writer, reader = client.do_exchange(descriptor, options=options)
         writer.begin(data.schema)
-        batch_count = 0
-        total_rows = 0
-        for batch in data.to_batches():
-            writer.write_batch(batch)
-            batch_count += 1
-            total_rows += batch.num_rows
-        writer.close()
-        result_batches = []
-        for chunk in reader:
-            result_batches.append(chunk.data)
-        if result_batches:
-            result_table = pa.Table.from_batches(result_batches)
-            logger.info(f"Exchanged {total_rows} rows in {batch_count} batches")
-            logger.info(f"Received {result_table.num_rows} rows back")
-            return result_table
-        else:
+        rows_per_batch = _rows_per_batch(data)
+        # Exchangers may stream results back while we are still sending, so the
+        # upload runs on its own thread to keep both directions of the call moving
+        executor = ThreadPoolExecutor(max_workers=1)
+        upload = executor.submit(self._write_table, writer, data, rows_per_batch)
+        completed = False
+        try:
+            for chunk in reader:
+                yield chunk.data
+            upload.result()
+            completed = True
+        finally:
+            if not completed:
+                # The caller stopped early or reading failed; cancel the call so
+                # an upload blocked on flow control returns instead of hanging
+                reader.cancel()
+            executor.shutdown(wait=True)
+            try:
+                writer.close()
+            except flight.FlightError:
+                # Closing a cancelled call reports the cancellation
+                if completed:
+                    raise
+        logger.info(
+            f"Exchanged {data.num_rows} rows in batches of up to {rows_per_batch} rows"
+        )
+
+    def exchange_data(
+        self, server_name: str, command: str, data: pa.Table
+    ) -> pa.RecordBatchReader:
+        """Sends data through an exchange and returns a reader over the results.
+
+        The exchange is drained before returning, so the call is finished even
+        if the reader is only partly consumed; use exchange_batches to handle
+        batches as they arrive.
+        """
+        batches = list(self.exchange_batches(server_name, command, data))
+        if not batches:
             logger.warning("No data received from exchange")
-            return pa.table({})
+            return pa.RecordBatchReader.from_batches(pa.schema([]), [])
+        return pa.RecordBatchReader.from_batches(batches[0].schema, batches)
+
+    @staticmethod
+    def _write_table(
+        writer: flight.FlightStreamWriter, data: pa.Table, rows_per_batch: int
+    ):
+        # Slicing into batches happens inside the writer, in a single call
+        writer.write_table(data, max_chunksize=rows_per_batch)
+        writer.done_writing()
 
 
 # ------------------------------------------------------------------------------
 # Data Generation
 # ------------------------------------------------------------------------------
+# Shared local DuckDB instance for reading and writing Parquet; each call takes
+# its own cursor so the buffer pool and catalog are set up only once, and the
+# Parquet footers it reads are cached for every cursor. It is opened on first
+# use, so importing this module starts no database
+_LOCAL_DB: Optional[duckdb.DuckDBPyConnection] = None
+_LOCAL_DB_LOCK = threading.Lock()
+
+
+def _local_db() -> duckdb.DuckDBPyConnection:
+    global _LOCAL_DB
+    with _LOCAL_DB_LOCK:
+        if _LOCAL_DB is None:
+            _LOCAL_DB = duckdb.connect(config={"threads": os.cpu_count()})
+            _LOCAL_DB.execute("SET GLOBAL parquet_metadata_cache = true")
+        return _LOCAL_DB
+
+
+# Generated datasets are persisted in the background; readers of a path wait
+# for its pending write before touching the file. Finished writes drop out of
+# the map, failed ones stay until a reader of the path has seen the error
+_PARQUET_WRITER = ThreadPoolExecutor(max_workers=1)
+_PENDING_WRITES: Dict[str, Future] = {}
+
+
+def _write_finished(filepath: str, future: Future):
+    if future.exception() is not None:
+        logger.error(f"Failed to save dataset to {filepath}: {future.exception()}")
+    elif _PENDING_WRITES.get(filepath) is future:
+        del _PENDING_WRITES[filepath]
+
+
+def _wait_for_write(filepath: str):
+    pending = _PENDING_WRITES.get(filepath)
+    if pending is not None:
+        try:
+            pending.result()
+        finally:
+            if _PENDING_WRITES.get(filepath) is pending:
+                del _PENDING_WRITES[filepath]
+
+
 class DataGenerator:
     """Responsible solely for generating sample data."""
 
@@ -188,52 +517,110 @@ class DataGenerator:
             "name": ["Alice", "Bob", "Charlie", "Dave", "Eve"],
             "value": [10.5, 20.0, 15.5, 30.0, 25.5],
         }
-        return pa.Table.from_pydict(data)
+        # Declared types, so Arrow converts the lists without inferring them
+        schema = pa.schema(
+            [("id", pa.int64()), ("name", pa.string()), ("value", pa.float64())]
+        )
+        return pa.Table.from_pydict(data, schema=schema)
 
     @staticmethod
     def create_flights_table(rows: int = 10000) -> pa.Table:
-        base_origins = ["JFK", "LAX", "ORD", "DFW", "SFO"]
-        base_destinations = ["SFO", "JFK", "LAX", "ORD", "DFW"]
+        base_origins = pa.array(["JFK", "LAX", "ORD", "DFW", "SFO"])
+        base_destinations = pa.array(["SFO", "JFK", "LAX", "ORD", "DFW"])
+
+        i = np.arange(rows, dtype=np.int64)
+        flight_ids = pa.array(i + 1)
+
+        # 2023-MM-DD HH:00:00 with month, day and hour cycling independently
+        months = np.datetime64("2023-01", "M") + (i % 12)
+        days = months.astype("datetime64[D]") + (i % 28)
+        departure_time = days.astype("datetime64[s]") + (i % 24) * 3600
 
         data = {
-            "flight_id": list(range(1, rows + 1)),
-            "flight_number": [f"Flight-{i}" for i in range(1, rows + 1)],
-            "origin": (base_origins * ((rows // len(base_origins)) + 1))[:rows],
-            "destination": (base_destinations * ((rows // len(base_destinations)) + 1))[
-                :rows
-            ],
-            "departure_time": [
-                f"2023-{(i % 12) + 1:02d}-{(i % 28) + 1:02d} {(i % 24):02d}:00:00"
-                for i in range(rows)
-            ],
-            "passengers": [50 + i % 200 for i in range(rows)],
+            "flight_id": flight_ids,
+            "flight_number": pc.binary_join_element_wise(
+                "Flight-", pc.cast(flight_ids, pa.string()), ""
+            ),
+            # Five codes over many rows: ship int8 indices plus a tiny dictionary
+            "origin": pa.DictionaryArray.from_arrays(
+                pa.array(i % len(base_origins), type=pa.int8()), base_origins
+            ),
+            "destination": pa.DictionaryArray.from_arrays(
+                pa.array(i % len(base_destinations), type=pa.int8()),
+                base_destinations,
+            ),
+            "departure_time": pa.array(departure_time, type=pa.timestamp("s")),
+            "passengers": pa.array(50 + i % 200),
         }
-        return pa.Table.from_pydict(data)
+        return pa.table(data)
 
     @staticmethod
     def load_or_create_parquet(
         filepath: str, rows: int = 10000, limit_rows: Optional[int] = None
     ) -> pa.Table:
+        _wait_for_write(filepath)
         if os.path.exists(filepath):
             logger.info(f"Loading existing data from {filepath}")
-            conn = duckdb.connect()
+            # Decode straight from the mapped file instead of going through DuckDB
             if limit_rows:
                 logger.info(f"Limiting to {limit_rows} rows for benchmarking")
-                return conn.sql(
-                    f"SELECT * FROM '{filepath}' LIMIT {limit_rows}"
-                ).fetch_arrow_table()
+                parquet_file = pq.ParquetFile(filepath, memory_map=True)
+                batches = []
+                remaining = limit_rows
+                for batch in parquet_file.iter_batches(batch_size=limit_rows):
+                    batches.append(batch.slice(0, remaining))
+                    remaining -= batches[-1].num_rows
+                    if remaining <= 0:
+                        break
+                return pa.Table.from_batches(batches, schema=parquet_file.schema_arrow)
             else:
                 logger.info(f"Loading all rows from {filepath}")
-                return conn.sql(f"SELECT * FROM '{filepath}'").fetch_arrow_table()
+                return pq.read_table(filepath, memory_map=True)
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         logger.info(f"Creating new dataset with {rows} rows")
         flights_table = DataGenerator.create_flights_table(rows)
-        conn = duckdb.connect()
-        conn.register("flights_temp", flights_table)
-        conn.execute(f"COPY flights_temp TO '{filepath}' (FORMAT PARQUET)")
-        logger.info(f"Saved dataset to {filepath}")
+        # The caller gets the in-memory table right away; the file follows
+        pending = _PARQUET_WRITER.submit(
+            DataGenerator._write_parquet, flights_table, filepath
+        )
+        _PENDING_WRITES[filepath] = pending
+        pending.add_done_callback(functools.partial(_write_finished, filepath))
         return flights_table
 
+    @staticmethod
+    def _write_parquet(table: pa.Table, filepath: str):
+        # DuckDB scans the registered table in place; the file only appears
+        # under its final name once it is complete
+        partial_path = f"{filepath}.partial"
+        conn = _local_db().cursor()
+        conn.register("flights_temp", table)
+        try:
+            conn.execute(
+                f"COPY flights_temp TO '{partial_path}' "
+                "(FORMAT PARQUET, COMPRESSION 'zstd', ROW_GROUP_SIZE 122880)"
+            )
+            os.replace(partial_path, filepath)
+        except Exception:
+            # Leave no half-written file behind
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        finally:
+            conn.unregister("flights_temp")
+        logger.info(f"Saved dataset to {filepath}")
+
+    @staticmethod
+    def stream_parquet(
+        filepath: str, rows_per_batch: int = 8192
+    ) -> pa.RecordBatchReader:
+        """Returns a reader that scans the Parquet file batch by batch."""
+        _wait_for_write(filepath)
+        logger.info(f"Streaming data from {filepath}")
+        conn = _local_db().cursor()
+        return conn.sql(
+            f"SELECT * FROM read_parquet('{filepath}', hive_partitioning=false)"
+        ).to_arrow_reader(rows_per_batch)
+
 
 # ------------------------------------------------------------------------------
 # Custom Exchanger for the Demo
@@ -244,43 +631,55 @@ class CustomStreamingExchanger(AbstractExchanger):
     This is used to demonstrate registering custom logic from the client.
     """
 
+    __slots__ = ()
+
     command = "my_streaming_exchanger"
 
     def exchange_f(self, context, reader, writer):
         start_time = time.time()
         total_rows = 0
         batch_count = 0
+        out_schema = None
         logger.info("Processing data in CustomStreamingExchanger")
-        all_incoming = []
         while True:
             try:
                 chunk = reader.read_chunk()
-                if chunk.data.num_rows == 0:
-                    break
-                all_incoming.append(chunk.data)
-                total_rows += chunk.data.num_rows
-                batch_count += 1
             except StopIteration:
                 break
-        if not all_incoming:
+            batch = chunk.data
+            if out_schema is None:
+                out_schema = processed_schema(batch.schema)
+                writer.begin(out_schema, options=write_options_for(context))
+            processed_col = all_true_array(batch.num_rows)
+            writer.write_batch(batch.append_column(PROCESSED_FIELD, processed_col))
+            total_rows += batch.num_rows
+            batch_count += 1
+        if out_schema is None:
             logger.info("No data received in exchanger")
             writer.begin(pa.schema([]))
             writer.close()
             return
-        table_in = pa.Table.from_batches(all_incoming)
-        processed_col = pa.array([True] * table_in.num_rows, pa.bool_())
-        table_out = table_in.append_column("processed", processed_col)
-        writer.begin(table_out.schema)
-        for batch in table_out.to_batches():
-            writer.write_batch(batch)
         writer.close()
-        duration = time.time() - start_time
-        logger.info(f"Processed {total_rows} rows in {duration*1000:.2f} ms")
+        # Lazily formatted; nothing is formatted below INFO
+        logger.info(
+            "Processed %d rows in %.2f ms",
+            total_rows,
+            (time.time() - start_time) * 1000,
+        )
 
 
 # ------------------------------------------------------------------------------
 # Benchmark Operations
 # ------------------------------------------------------------------------------
+# ANSI codes used by the benchmark report
+RESET = "\033[0m"
+BOLD = "\033[1m"
+GREEN = "\033[32m"
+BLUE = "\033[34m"
+CYAN = "\033[36m"
+YELLOW = "\033[33m"
+
+
 class Benchmarker:
     """
     Benchmarks various data operations.
@@ -294,12 +693,16 @@ class Benchmarker:
     def benchmark_get(self, server_name: str, query: str) -> Dict[str, Any]:
         logger.info(f"Benchmarking GET on {server_name}: {query}")
         start_time = time.time()
-        result = self.data_ops.execute_query(server_name, query)
+        # Batches are counted and dropped as they arrive, so the timing covers
+        # the stream itself rather than assembling a table on this side
+        rows = 0
+        for batch in self.data_ops.stream_query(server_name, query):
+            rows += batch.num_rows
         duration = time.time() - start_time
         metrics = {
-            "rows": result.num_rows,
+            "rows": rows,
             "duration": duration,
-            "throughput": result.num_rows / duration if duration > 0 else 0,
+            "throughput": rows / duration if duration > 0 else 0,
         }
         logger.info(f"GET: {metrics['rows']} rows in {metrics['duration']*1000:.2f} ms")
         logger.info(f"Throughput: {metrics['throughput']:,.0f} rows/second")
@@ -311,14 +714,14 @@ class Benchmarker:
     ) -> Dict[str, Any]:
         logger.info(f"Benchmarking transfer {from_server} → {to_server}: {table_name}")
         start_time = time.time()
-        rows, transfer_time = self.data_ops.transfer_table(
+        rows, transfer_time = self.data_ops.pull_table(
             from_server, to_server, table_name
         )
         total_time = time.time() - start_time
         dest_rows = (
             self.data_ops.execute_query(to_server, f"SELECT COUNT(*) FROM {table_name}")
-            .to_pandas()
-            .iloc[0, 0]
+            .column(0)[0]
+            .as_py()
         )
         metrics = {
             "rows": rows,
@@ -339,18 +742,28 @@ class Benchmarker:
     ) -> Dict[str, Any]:
         logger.info(f"Benchmarking exchange on {server_name}: {command}")
         start_time = time.time()
-        result = self.data_ops.exchange_data(server_name, command, data)
+        # Results are checked batch by batch instead of being collected first
+        output_rows = 0
+        has_processed = False
+        all_processed = True
+        for batch in self.data_ops.exchange_batches(server_name, command, data):
+            output_rows += batch.num_rows
+            if "processed" in batch.schema.names:
+                has_processed = True
+                # Reduce over the packed bits; a null counts as not processed
+                all_processed = all_processed and bool(
+                    pc.all(
+                        batch.column("processed"), skip_nulls=False, min_count=0
+                    ).as_py()
+                )
         duration = time.time() - start_time
+        all_processed = has_processed and all_processed
         metrics = {
             "input_rows": data.num_rows,
-            "output_rows": result.num_rows,
+            "output_rows": output_rows,
             "duration": duration,
             "throughput": data.num_rows / duration if duration > 0 else 0,
         }
-        has_processed = "processed" in result.column_names
-        all_processed = False
-        if has_processed:
-            all_processed = all(result.column("processed").to_pylist())
         metrics["has_processed_column"] = has_processed
         metrics["all_processed"] = all_processed
         logger.info(
@@ -363,75 +776,97 @@ class Benchmarker:
 
     def print_formatted_report(self, total_rows: int):
         """Prints a nicely formatted benchmark report with colors and formatting."""
-        # ANSI color codes
-        RESET = "\033[0m"
-        BOLD = "\033[1m"
-        GREEN = "\033[32m"
-        BLUE = "\033[34m"
-        CYAN = "\033[36m"
-        YELLOW = "\033[33m"
+        # Build the whole report first so stdout is written and flushed once
+        report = io.StringIO()
 
         # Header
-        print(f"\n{BOLD}{'=' * 80}{RESET}")
-        print(f"{BOLD}{BLUE}🦆 MALLARD BENCHMARK REPORT 🦆{RESET}")
-        print(f"{BOLD}{'=' * 80}{RESET}")
+        print(f"\n{BOLD}{'=' * 80}{RESET}", file=report)
+        print(f"{BOLD}{BLUE}🦆 MALLARD BENCHMARK REPORT 🦆{RESET}", file=report)
+        print(f"{BOLD}{'=' * 80}{RESET}", file=report)
 
         # Dataset info
-        print(f"\n{BOLD}📊 Dataset Information:{RESET}")
-        print(f"  • Total rows: {CYAN}{total_rows:,}{RESET}")
+        print(f"\n{BOLD}📊 Dataset Information:{RESET}", file=report)
+        print(f"  • Total rows: {CYAN}{total_rows:,}{RESET}", file=report)
 
         # Performance metrics
-        print(f"\n{BOLD}⚡ Performance Metrics:{RESET}")
+        print(f"\n{BOLD}⚡ Performance Metrics:{RESET}", file=report)
 
         if "get" in self.metrics:
             get = self.metrics["get"]
-            print(f"  • {BOLD}GET Operation:{RESET}")
-            print(f"    - Duration: {CYAN}{get['duration']*1000:.2f} ms{RESET}")
+            print(f"  • {BOLD}GET Operation:{RESET}", file=report)
+            print(
+                f"    - Duration: {CYAN}{get['duration']*1000:.2f} ms{RESET}",
+                file=report,
+            )
             print(
-                f"    - Throughput: {GREEN}{get['throughput']:,.0f} rows/second{RESET}"
+                f"    - Throughput: {GREEN}{get['throughput']:,.0f} rows/second{RESET}",
+                file=report,
             )
 
         if "transfer" in self.metrics:
             transfer = self.metrics["transfer"]
-            print(f"  • {BOLD}TRANSFER Operation:{RESET}")
+            print(f"  • {BOLD}TRANSFER Operation:{RESET}", file=report)
+            print(
+                f"    - Duration: {CYAN}{transfer['transfer_time']*1000:.2f} ms{RESET}",
+                file=report,
+            )
             print(
-                f"    - Duration: {CYAN}{transfer['transfer_time']*1000:.2f} ms{RESET}"
+                f"    - Throughput: {GREEN}{transfer['throughput']:,.0f} rows/second{RESET}",
+                file=report,
             )
             print(
-                f"    - Throughput: {GREEN}{transfer['throughput']:,.0f} rows/second{RESET}"
+                f"    - Verified rows: {YELLOW}{transfer['verified_rows']:,}{RESET}",
+                file=report,
             )
-            print(f"    - Verified rows: {YELLOW}{transfer['verified_rows']:,}{RESET}")
 
         if "exchange" in self.metrics:
             exchange = self.metrics["exchange"]
-            print(f"  • {BOLD}EXCHANGE Operation:{RESET}")
-            print(f"    - Duration: {CYAN}{exchange['duration']*1000:.2f} ms{RESET}")
+            print(f"  • {BOLD}EXCHANGE Operation:{RESET}", file=report)
+            print(
+                f"    - Duration: {CYAN}{exchange['duration']*1000:.2f} ms{RESET}",
+                file=report,
+            )
             print(
-                f"    - Throughput: {GREEN}{exchange['throughput']:,.0f} rows/second{RESET}"
+                f"    - Throughput: {GREEN}{exchange['throughput']:,.0f} rows/second{RESET}",
+                file=report,
             )
             print(
-                f"    - Processed column: {YELLOW}{exchange['has_processed_column']}{RESET}"
+                f"    - Processed column: {YELLOW}{exchange['has_processed_column']}{RESET}",
+                file=report,
             )
 
         # Footer
-        print(f"\n{BOLD}{'=' * 80}{RESET}")
-        print(f"{BOLD}{BLUE}🚀 MALLARD - High-Performance Data Exchange{RESET}")
-        print(f"{BOLD}{'=' * 80}{RESET}\n")
+        print(f"\n{BOLD}{'=' * 80}{RESET}", file=report)
+        print(
+            f"{BOLD}{BLUE}🚀 MALLARD - High-Performance Data Exchange{RESET}",
+            file=report,
+        )
+        print(f"{BOLD}{'=' * 80}{RESET}\n", file=report)
+        sys.stdout.write(report.getvalue())
+        sys.stdout.flush()
 
 
 # ------------------------------------------------------------------------------
 # Demo Runner
 # ------------------------------------------------------------------------------
+def _preview(table: pa.Table, rows: int = 20) -> str:
+    """Formats the first rows of a table for logging without pandas."""
+    return table.slice(0, rows).to_string(preview_cols=table.num_columns)
+
+
 class DemoRunner:
     """
     Orchestrates the demo: it sets up data, registers custom exchangers,
     runs simple operations and benchmarks.
     """
 
-    def __init__(self):
+    def __init__(self, server_manager: Optional[FlightServerManager] = None):
+        # Servers started in this process, if any; others are probed over gRPC
+        self.server_manager = server_manager
         self.client_manager = FlightClientManager()
         self.data_ops = DataOperations(self.client_manager)
         self.benchmarker = Benchmarker(self.data_ops)
+        self.executor = ThreadPoolExecutor(max_workers=1)
         signal.signal(signal.SIGINT, self._handle_interrupt)
         signal.signal(signal.SIGTERM, self._handle_interrupt)
 
@@ -442,31 +877,62 @@ class DemoRunner:
 
     def setup(self):
         logger.info("Setting up demo environment...")
+        # Decoding the local dataset needs no server, so it runs in the
+        # background while the servers come up and receive their data
+        self.flights_path, flights_table = self._locate_flights_parquet()
+        self.flights_future = self.executor.submit(
+            self._load_flights_table, flights_table
+        )
         self._wait_for_servers()
-        self._setup_sample_data()
-        self._register_custom_exchanger()
+        # The uploads and the registration use independent calls, so they run
+        # side by side on separate pooled clients
+        with ThreadPoolExecutor(max_workers=3) as setup_executor:
+            tasks = [
+                setup_executor.submit(self._upload_flights),
+                setup_executor.submit(self._upload_simple),
+                setup_executor.submit(self._register_custom_exchanger),
+            ]
+            for task in tasks:
+                task.result()
 
     def _wait_for_servers(self, max_attempts: int = 30):
         logger.info("Waiting for servers to be ready...")
+        # In-process servers signal readiness directly, so the ping below
+        # succeeds on its first attempt
+        if self.server_manager is not None:
+            if not self.server_manager.wait_until_ready(timeout=30):
+                raise RuntimeError("Servers not ready after 30 seconds")
+        clients = [
+            self.client_manager.get_client(server) for server in ["server1", "server2"]
+        ]
+        delay = 0.05
         for attempt in range(max_attempts):
             try:
-                for server in ["server1", "server2"]:
-                    result = self.data_ops.execute_query(server, "SELECT 1")
-                    if result.num_rows != 1:
-                        raise ValueError(f"Unexpected result from {server}")
+                for client in clients:
+                    # Pings the channel without running a query on the server
+                    client.wait_for_available(timeout=0.5)
                 logger.info("All servers are ready")
                 return True
             except Exception as e:
                 logger.warning(
                     f"Servers not ready yet (attempt {attempt+1}/{max_attempts}): {e}"
                 )
-                time.sleep(1)
+                time.sleep(delay)
+                delay = min(1.0, delay * 2)
         raise RuntimeError(f"Servers not ready after {max_attempts} attempts")
 
-    def _setup_sample_data(self):
+    def _upload_simple(self):
         simple_table = DataGenerator.create_sample_table()
         self.data_ops.create_table("server1", "simple_table", simple_table)
 
+    def _upload_flights(self):
+        # Stream the flights file straight into server1 instead of loading it first
+        self.data_ops.create_table(
+            "server1", "flights", DataGenerator.stream_parquet(self.flights_path)
+        )
+
+    def _locate_flights_parquet(self) -> Tuple[str, Optional[pa.Table]]:
+        """Path of the flights dataset, plus the table if it was just generated."""
         # Use the correct path to the flights.parquet file with 24 million rows
         data_dir = os.path.join(
             os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"
@@ -476,26 +942,30 @@ class DemoRunner:
 
         if os.path.exists(parquet_path):
             logger.info(f"Using existing flights dataset at {parquet_path}")
-            self.flights_table = DataGenerator.load_or_create_parquet(parquet_path)
-            row_count = self.flights_table.num_rows
-            logger.info(f"Loaded flights dataset with {row_count:,} rows")
-            self.data_ops.create_table("server1", "flights", self.flights_table)
-        else:
-            # Fallback to the default location
-            logger.warning(
-                f"Could not find flights dataset at {parquet_path}, using default location"
-            )
-            default_data_dir = os.path.join(
-                os.path.dirname(os.path.abspath(__file__)), "data"
-            )
-            os.makedirs(default_data_dir, exist_ok=True)
-            default_parquet_path = os.path.join(default_data_dir, "flights.parquet")
-            self.flights_table = DataGenerator.load_or_create_parquet(
-                default_parquet_path
-            )
-            row_count = self.flights_table.num_rows
-            logger.info(f"Loaded flights dataset with {row_count:,} rows")
-            self.data_ops.create_table("server1", "flights", self.flights_table)
+            return parquet_path, None
+
+        # Fallback to the default location
+        logger.warning(
+            f"Could not find flights dataset at {parquet_path}, using default location"
+        )
+        default_data_dir = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "data"
+        )
+        os.makedirs(default_data_dir, exist_ok=True)
+        default_parquet_path = os.path.join(default_data_dir, "flights.parquet")
+        if os.path.exists(default_parquet_path):
+            return default_parquet_path, None
+        # Keep the generated table so it is not decoded back from the file
+        return default_parquet_path, DataGenerator.load_or_create_parquet(
+            default_parquet_path
+        )
+
+    def _load_flights_table(self, flights_table: Optional[pa.Table] = None) -> pa.Table:
+        # The exchange benchmark sends the whole dataset from the client
+        if flights_table is None:
+            flights_table = DataGenerator.load_or_create_parquet(self.flights_path)
+        logger.info(f"Loaded flights dataset with {flights_table.num_rows:,} rows")
+        return flights_table
 
     def _register_custom_exchanger(self):
         logger.info("Registering custom exchanger...")
@@ -511,12 +981,12 @@ class DemoRunner:
         logger.info("=" * 80)
 
         result = self.data_ops.execute_query("server1", "SELECT * FROM simple_table")
-        logger.info(f"Simple table contents:\n{result.to_pandas()}")
+        logger.info(f"Simple table contents:\n{_preview(result)}")
 
         self.data_ops.transfer_table("server1", "server2", "simple_table")
 
         result = self.data_ops.execute_query("server2", "SELECT * FROM simple_table")
-        logger.info(f"Table transferred to server2:\n{result.to_pandas()}")
+        logger.info(f"Table transferred to server2:\n{_preview(result)}")
 
     def run_benchmarks(self):
         logger.info("\n" + "=" * 80)
@@ -532,6 +1002,7 @@ class DemoRunner:
         )
 
         logger.info("\n--- Benchmark Custom Exchange ---")
+        self.flights_table = self.flights_future.result()
         exchange_metrics = self.benchmarker.benchmark_exchange(
             "server1", "my_streaming_exchanger", self.flights_table
         )
@@ -541,6 +1012,7 @@ class DemoRunner:
 
     def cleanup(self):
         logger.info("Cleaning up resources...")
+        self.executor.shutdown(wait=False)
         self.client_manager.close_all()
 
     def run(self):
@@ -563,13 +1035,13 @@ class DemoRunner:
 def main():
     # Start two Flight server instances via the server manager.
     server_configs = [
-        FlightServerConfig(location="grpc://localhost:8815", server_id=":memory:"),
-        FlightServerConfig(location="grpc://localhost:8816", server_id=":memory:"),
+        FlightServerConfig(location=SERVER1_LOCATION, server_id=":memory:"),
+        FlightServerConfig(location=SERVER2_LOCATION, server_id=":memory:"),
     ]
     server_manager = FlightServerManager(server_configs)
     try:
         server_manager.start_servers()
-        demo = DemoRunner()
+        demo = DemoRunner(server_manager)
         success = demo.run()
         sys.exit(0 if success else 1)
     except KeyboardInterrupt:
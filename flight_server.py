@@ -1,22 +1,43 @@
 import base64
+import functools
+import hmac
+import json
 import logging
 import secrets
 import os
+import re
 import signal
 import sys
 import threading
 import time
 import argparse
-import warnings
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Union
+from urllib.parse import unquote, urlparse
 
 import duckdb
 import pyarrow as pa
 import pyarrow.flight as flight
 from cloudpickle import loads
 
-# Filter out Arrow alignment warnings
-warnings.filterwarnings("ignore", message="An input buffer was poorly aligned")
+# Buffers received over Flight are not always aligned to their data type, and
+# DuckDB scans registered Arrow data through Acero, which then logs a warning
+# and falls back to slow paths. Have Acero copy such buffers to aligned memory.
+os.environ.setdefault("ACERO_ALIGNMENT_HANDLING", "reallocate")
+
+# Route Arrow allocations through jemalloc when this pyarrow build includes it
+try:
+    pa.set_memory_pool(pa.jemalloc_memory_pool())
+except NotImplementedError:
+    pass
+
+# Rows per batch when streaming query results, matching DuckDB's row group size
+STREAM_BATCH_ROWS = 122880
+
+# Exchange commands starting with one of these keywords are run as SQL; one
+# case-insensitive match instead of upper-casing and testing each keyword
+SQL_COMMAND_PATTERN = re.compile(
+    r"(?:SELECT|INSERT|UPDATE|DELETE|CREATE|DROP|ALTER|WITH)", re.IGNORECASE
+)
 
 # ------------------------------------------------------------------------------
 # Logging Configuration
@@ -35,12 +56,74 @@ logger = logging.getLogger("mallard")
 class AbstractExchanger:
     """Interface for custom data exchangers."""
 
+    # Exchangers keep no per-instance state
+    __slots__ = ()
+
     command = ""
 
     def exchange_f(self, context, reader, writer):
         raise NotImplementedError("Subclasses must implement exchange_f")
 
 
+# IPC options for streams sent in either direction. Streams between processes
+# on one machine get uncompressed bodies, since copies are cheap there and
+# compression only burns CPU; streams to other hosts get LZ4-compressed bodies,
+# a fraction of the bytes on the wire
+LOCAL_WRITE_OPTIONS = pa.ipc.IpcWriteOptions(compression=None, use_threads=True)
+REMOTE_WRITE_OPTIONS = pa.ipc.IpcWriteOptions(compression="lz4_frame", use_threads=True)
+
+# gRPC peer strings of clients on this machine, e.g. "ipv4:127.0.0.1:50612"
+LOOPBACK_PEER_PREFIXES = ("unix:", "ipv4:127.", "ipv6:[::1]")
+
+# Hosts in Flight locations that never leave this machine
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+def is_loopback_location(location: str) -> bool:
+    """Whether a Flight location points at this machine."""
+    if location.startswith("grpc+unix://"):
+        return True
+    return urlparse(location).hostname in LOOPBACK_HOSTS
+
+
+def write_options_for(context) -> pa.ipc.IpcWriteOptions:
+    """IPC write options for a response, compressed unless the peer is local."""
+    if unquote(context.peer()).startswith(LOOPBACK_PEER_PREFIXES):
+        return LOCAL_WRITE_OPTIONS
+    return REMOTE_WRITE_OPTIONS
+
+
+# Column the default exchangers append to every batch
+PROCESSED_FIELD = pa.field("processed", pa.bool_())
+
+
+@functools.lru_cache(maxsize=64)
+def processed_schema(schema: pa.Schema) -> pa.Schema:
+    """The input schema plus the exchangers' boolean "processed" column.
+
+    Cached, so an input schema seen before is extended only once per process.
+    """
+    return schema.append(PROCESSED_FIELD)
+
+
+# Bitmap of set bits shared by every all-true array of up to 1M rows, which
+# covers any batch this package produces
+_ALL_TRUE_BITS = pa.py_buffer(b"\xff" * (128 * 1024))
+
+
+def all_true_array(length: int) -> pa.BooleanArray:
+    """An all-true boolean array built straight from a bitmap of set bits.
+
+    No per-row values are materialized and the array has no validity bitmap.
+    """
+    nbytes = (length + 7) >> 3
+    if nbytes <= _ALL_TRUE_BITS.size:
+        values = _ALL_TRUE_BITS.slice(0, nbytes)
+    else:
+        values = pa.py_buffer(b"\xff" * nbytes)
+    return pa.Array.from_buffers(pa.bool_(), length, [None, values])
+
+
 # ------------------------------------------------------------------------------
 # Default Exchanger Implementation
 # ------------------------------------------------------------------------------
@@ -50,58 +133,63 @@ class MyStreamingExchanger(AbstractExchanger):
     This class has one responsibility: transforming incoming Arrow data.
     """
 
+    __slots__ = ()
+
     command = "my_streaming_exchanger"
 
     def exchange_f(self, context, reader, writer):
         start_time = time.time()
         total_rows = 0
         batch_count = 0
+        out_schema = None
 
         logger.info("MyStreamingExchanger processing data")
 
-        all_incoming = []
-        try:
-            while True:
-                try:
-                    chunk = reader.read_chunk()
-                    if chunk.data.num_rows == 0:
-                        break
-                    all_incoming.append(chunk.data)
-                    total_rows += chunk.data.num_rows
-                    batch_count += 1
-                except StopIteration:
-                    break
-        except Exception as e:
-            logger.error(f"Error reading data: {e}")
-            writer.begin(pa.schema([]))
-            writer.close()
-            return
+        while True:
+            try:
+                chunk = reader.read_chunk()
+            except StopIteration:
+                break
+            except Exception as e:
+                # Output is already streaming; ending normally here would hand
+                # the client a truncated result that looks complete
+                logger.error(f"Error reading data: {e}")
+                raise
+
+            try:
+                batch = chunk.data
+                if out_schema is None:
+                    out_schema = processed_schema(batch.schema)
+                    writer.begin(out_schema, options=write_options_for(context))
+                # One C++ call; no Python list of the batch's columns
+                processed_col = all_true_array(batch.num_rows)
+                writer.write_batch(batch.append_column(PROCESSED_FIELD, processed_col))
+                total_rows += batch.num_rows
+                batch_count += 1
+            except Exception as e:
+                logger.error(f"Error processing data: {e}")
+                raise
 
-        if not all_incoming:
+        if out_schema is None:
             logger.info("No data received in exchanger")
             writer.begin(pa.schema([]))
             writer.close()
             return
 
-        try:
-            table_in = pa.Table.from_batches(all_incoming)
-            processing_time = time.time() - start_time
-            logger.info(f"Processed {total_rows:,} rows in {batch_count} batches")
-            logger.info(f"Processing time: {processing_time*1000:.2f} ms")
+        writer.close()
+        # One lazily formatted record; nothing is formatted below INFO
+        logger.info(
+            "Processed %d rows in %d batches in %.2f ms",
+            total_rows,
+            batch_count,
+            (time.time() - start_time) * 1000,
+        )
 
-            processed_col = pa.array([True] * table_in.num_rows, pa.bool_())
-            table_out = table_in.append_column("processed", processed_col)
 
-            writer.begin(table_out.schema)
-            send_start = time.time()
-            for batch in table_out.to_batches():
-                writer.write_batch(batch)
-            writer.close()
-            send_time = time.time() - send_start
-            logger.info(f"Response sent in {send_time*1000:.2f} ms")
-        except Exception as e:
-            logger.error(f"Error processing data: {e}")
-            raise
+# Exchangers available on every server; clients register these by command name
+EXCHANGER_REGISTRY: Dict[str, type] = {
+    MyStreamingExchanger.command: MyStreamingExchanger,
+}
 
 
 # ------------------------------------------------------------------------------
@@ -113,16 +201,39 @@ class AuthMiddlewareFactory(flight.ServerMiddlewareFactory):
     This class is responsible only for validating credentials.
     """
 
+    # start_call runs on every RPC; slots keep its attribute reads off a dict
+    __slots__ = (
+        "credentials",
+        "_passwords",
+        "_token_middleware",
+        "_token_lock",
+    )
+
+    # Issued tokens are token_urlsafe(TOKEN_BYTES), which is always this long
+    TOKEN_BYTES = 32
+    TOKEN_LENGTH = len(secrets.token_urlsafe(TOKEN_BYTES))
+
+    # Most tokens kept valid at once; the oldest login is dropped past this
+    MAX_TOKENS = 1024
+
     def __init__(self, credentials: Dict[str, str]):
         self.credentials = credentials
-        self.tokens = {}
+        # Passwords encoded once, ready for constant-time comparison
+        self._passwords = {
+            user: password.encode("utf-8") for user, password in credentials.items()
+        }
+        # Middleware is stateless beyond its token, so each issued token keeps
+        # one instance that every later call presenting it reuses. Insertion
+        # order is login order, so the first entry is always the oldest
+        self._token_middleware: Dict[str, AuthMiddleware] = {}
+        self._token_lock = threading.Lock()
 
     def start_call(self, info, headers):
-        auth_header = next(
-            (headers[k][0] for k in headers if k.lower() == "authorization"), None
-        )
-        if not auth_header:
+        # gRPC metadata keys arrive lowercased, so one lookup finds the header
+        auth_values = headers.get("authorization")
+        if not auth_values:
             raise flight.FlightUnauthenticatedError("No credentials supplied")
+        auth_header = auth_values[0]
 
         auth_type, _, value = auth_header.partition(" ")
         if auth_type == "Basic":
@@ -133,27 +244,54 @@ class AuthMiddlewareFactory(flight.ServerMiddlewareFactory):
 
     def _handle_basic_auth(self, value):
         try:
-            decoded = base64.b64decode(value).decode("utf-8")
-            username, _, password = decoded.partition(":")
-            if password != self.credentials.get(username):
-                raise flight.FlightUnauthenticatedError("Invalid username or password")
-            token = secrets.token_urlsafe(32)
-            self.tokens[token] = username
-            return AuthMiddleware(token)
-        except Exception as e:
+            decoded = base64.b64decode(value, validate=True).decode("utf-8")
+        except ValueError as e:
             logger.error(f"Basic auth error: {e}")
             raise flight.FlightUnauthenticatedError("Authentication failed")
+        username, _, password = decoded.partition(":")
+        expected = self._passwords.get(username)
+        # compare_digest takes as long to reject a wrong password as to accept
+        # the right one; unknown users are compared too, against a stand-in
+        matched = hmac.compare_digest(
+            password.encode("utf-8"), expected if expected is not None else b""
+        )
+        if expected is None or not matched:
+            logger.error("Basic auth error: Invalid username or password")
+            raise flight.FlightUnauthenticatedError("Authentication failed")
+        token = secrets.token_urlsafe(self.TOKEN_BYTES)
+        middleware = AuthMiddleware(token)
+        with self._token_lock:
+            self._token_middleware[token] = middleware
+            if len(self._token_middleware) > self.MAX_TOKENS:
+                del self._token_middleware[next(iter(self._token_middleware))]
+        logger.info(f"Issued token for {username}")
+        return middleware
 
     def _handle_token_auth(self, token):
-        username = self.tokens.get(token)
-        if username is None:
+        # A token of the wrong length was never issued; skip the lookup
+        if len(token) != self.TOKEN_LENGTH:
+            raise flight.FlightUnauthenticatedError("Invalid token")
+        middleware = self._token_middleware.get(token)
+        if middleware is None:
             raise flight.FlightUnauthenticatedError("Invalid token")
-        return AuthMiddleware(token)
+        return middleware
+
+
+class NoOpAuthHandler(flight.ServerAuthHandler):
+    """Accepts every handshake; AuthMiddlewareFactory authenticates calls."""
+
+    def authenticate(self, outgoing, incoming):
+        pass
+
+    def is_valid(self, token):
+        return ""
 
 
 class AuthMiddleware(flight.ServerMiddleware):
     """Implements token-based authentication."""
 
+    __slots__ = ("token",)
+
     def __init__(self, token):
         self.token = token
 
@@ -237,17 +375,26 @@ class DuckDBFlightServer(flight.FlightServerBase):
         shutdown_event: threading.Event,
         database_manager: Optional[DatabaseManager] = None,
     ):
-        super().__init__(config.location)
+        # Middleware only takes effect when handed to the base constructor
+        middleware = None
+        auth_handler = None
+        if config.auth_enabled:
+            middleware = {"auth": AuthMiddlewareFactory(config.credentials)}
+            # Lets the Handshake RPC through; the middleware does the checking
+            auth_handler = NoOpAuthHandler()
+        super().__init__(
+            config.location, auth_handler=auth_handler, middleware=middleware
+        )
         self.config = config
         self.shutdown_event = shutdown_event
         self.server_id = config.server_id
         self.database_manager = database_manager or DatabaseManager(config.db_path)
         self.db_conn = self.database_manager.connection
 
-        if config.auth_enabled:
-            self.middleware = {"auth": AuthMiddlewareFactory(config.credentials)}
-
         self._shutdown_requested = False
+        # Set once the server is listening and its database answers queries
+        self.ready = threading.Event()
+        self._create_lock = threading.Lock()
         self.exchangers: Dict[str, AbstractExchanger] = {}
         self._register_default_exchangers()
         logger.info(f"Server {self.server_id} initialized at {config.location}")
@@ -262,7 +409,8 @@ class DuckDBFlightServer(flight.FlightServerBase):
 
     def health_check(self) -> bool:
         try:
-            self.db_conn.execute("SELECT 1")
+            with self.db_conn.cursor() as conn:
+                conn.execute("SELECT 1")
             return True
         except Exception as e:
             logger.error(f"Health check failed: {e}")
@@ -272,6 +420,10 @@ class DuckDBFlightServer(flight.FlightServerBase):
         logger.info(f"Starting server at {self.config.location}")
         server_thread = threading.Thread(target=self._serve_thread, daemon=True)
         server_thread.start()
+        # The listener was bound in the constructor, so requests are accepted
+        # from here on
+        if self.health_check():
+            self.ready.set()
         return server_thread
 
     def _serve_thread(self):
@@ -307,7 +459,7 @@ class DuckDBFlightServer(flight.FlightServerBase):
                 exchanger.exchange_f(context, reader, writer)
                 return
             if self._is_sql_query(command):
-                self._handle_sql_exchange(command, writer)
+                self._handle_sql_exchange(context, command, writer)
                 return
             available = list(self.exchangers.keys())
             error_msg = f"Unknown exchange command: {command}. Available: {available}"
@@ -318,24 +470,18 @@ class DuckDBFlightServer(flight.FlightServerBase):
             raise
 
     def _is_sql_query(self, command: str) -> bool:
-        sql_keywords = [
-            "SELECT",
-            "INSERT",
-            "UPDATE",
-            "DELETE",
-            "CREATE",
-            "DROP",
-            "ALTER",
-            "WITH",
-        ]
-        return any(command.upper().startswith(kw) for kw in sql_keywords)
+        return SQL_COMMAND_PATTERN.match(command) is not None
 
-    def _handle_sql_exchange(self, command: str, writer: flight.FlightDataStream):
+    def _handle_sql_exchange(
+        self, context, command: str, writer: flight.FlightDataStream
+    ):
         logger.info(f"Executing SQL query via exchange: {command}")
-        result_table = self.db_conn.sql(command).fetch_arrow_table()
-        writer.begin(result_table.schema)
-        for batch in result_table.to_batches():
-            writer.write_batch(batch)
+        # Batches are sent as DuckDB produces them, from a cursor of our own
+        with self.db_conn.cursor() as conn:
+            reader = conn.sql(command).to_arrow_reader(STREAM_BATCH_ROWS)
+            writer.begin(reader.schema, options=write_options_for(context))
+            for batch in reader:
+                writer.write_batch(batch)
         writer.close()
         logger.info("SQL query execution complete")
 
@@ -345,8 +491,12 @@ class DuckDBFlightServer(flight.FlightServerBase):
             logger.info(f"Executing query: {query}")
             if self._is_ddl_statement(query):
                 return self._handle_ddl_statement(query)
-            result_table = self.db_conn.sql(query).fetch_arrow_table()
-            return flight.RecordBatchStream(result_table)
+            # A cursor per request, so concurrent streams don't share a result.
+            # Batches go out as DuckDB produces them; the reader keeps the
+            # cursor alive until the stream is done with it
+            conn = self.db_conn.cursor()
+            reader = conn.sql(query).to_arrow_reader(STREAM_BATCH_ROWS)
+            return flight.RecordBatchStream(reader, options=write_options_for(context))
         except Exception as e:
             logger.error(f"Error in do_get: {e}")
             raise
@@ -355,7 +505,8 @@ class DuckDBFlightServer(flight.FlightServerBase):
         return query.strip().upper().startswith(("CREATE", "DROP", "ALTER"))
 
     def _handle_ddl_statement(self, query: str) -> flight.FlightDataStream:
-        self.db_conn.execute(query)
+        with self.db_conn.cursor() as conn:
+            conn.execute(query)
         return flight.RecordBatchStream(pa.table({"status": ["OK"]}))
 
     def do_put(self, context, descriptor, reader, writer):
@@ -366,38 +517,36 @@ class DuckDBFlightServer(flight.FlightServerBase):
                 table_name = descriptor.command.decode("utf-8")
             logger.info(f"Receiving data for table: {table_name}")
 
-            batches = []
-            while True:
-                try:
-                    batch, metadata = reader.read_chunk()
-                    if batch.num_rows > 0:
-                        batches.append(batch)
-                except StopIteration:
-                    break
-
-            if not batches:
+            # DuckDB pulls batches off the stream as it inserts them, so the
+            # upload is never held in memory as a whole
+            rows = self._insert_table(table_name, reader.to_reader())
+            if rows == 0:
                 logger.warning(f"No data received for {table_name}")
-                return
-
-            table = pa.Table.from_batches(batches)
-            self._insert_table(table_name, table)
         except Exception as e:
             logger.error(f"Error in do_put: {e}")
             raise
 
-    def _insert_table(self, table_name: str, table: pa.Table):
+    def _insert_table(
+        self, table_name: str, data: Union[pa.Table, pa.RecordBatchReader]
+    ) -> int:
         temp_name = f"temp_{table_name}"
-        self.db_conn.register(temp_name, table)
-        self.db_conn.execute(
-            f"""
-            CREATE TABLE IF NOT EXISTS {table_name} AS 
-            SELECT * FROM {temp_name} LIMIT 0;
-            INSERT INTO {table_name} 
-            SELECT * FROM {temp_name};
-            """
-        )
-        self.db_conn.unregister(temp_name)
-        logger.info(f"Inserted {table.num_rows:,} rows into {table_name}")
+        # Concurrent uploads must not share one connection's pending result
+        with self.db_conn.cursor() as conn:
+            # Create the target from the schema alone so a reader is scanned
+            # once, straight from a relation with no SQL to parse; parallel
+            # uploads into one new table must not race to create it
+            with self._create_lock:
+                try:
+                    conn.from_arrow(data.schema.empty_table()).create(table_name)
+                except duckdb.CatalogException:
+                    pass
+            conn.register(temp_name, data)
+            (rows,) = conn.execute(
+                f"INSERT INTO {table_name} SELECT * FROM {temp_name}"
+            ).fetchone()
+            conn.unregister(temp_name)
+        logger.info(f"Inserted {rows:,} rows into {table_name}")
+        return rows
 
     def do_action(self, context, action):
         try:
@@ -409,6 +558,8 @@ class DuckDBFlightServer(flight.FlightServerBase):
             logger.info(f"Server {self.server_id} received action: {action_type}")
             if action_type == AddExchangeAction.name:
                 return self._handle_add_exchange(action)
+            if action_type == PullFromAction.name:
+                return self._handle_pull_from(action)
             logger.error(f"Unknown action: {action_type}")
             raise flight.FlightServerError(f"Unknown action: {action_type}")
         except Exception as e:
@@ -416,7 +567,7 @@ class DuckDBFlightServer(flight.FlightServerBase):
             raise
 
     def _handle_add_exchange(self, action) -> List[flight.Result]:
-        exchanger_class = loads(action.body.to_pybytes())
+        exchanger_class = self._resolve_exchanger(action.body.to_pybytes())
         if not issubclass(exchanger_class, AbstractExchanger):
             raise ValueError("Exchanger must be a subclass of AbstractExchanger")
         exchanger_instance = exchanger_class()
@@ -426,6 +577,30 @@ class DuckDBFlightServer(flight.FlightServerBase):
         logger.info(f"Current exchangers: {list(self.exchangers.keys())}")
         return [flight.Result(f"Registered {command}".encode())]
 
+    def _handle_pull_from(self, action) -> List[flight.Result]:
+        request = json.loads(action.body.to_pybytes())
+        location, table_name = request["location"], request["table"]
+        logger.info(f"Server {self.server_id} pulling {table_name} from {location}")
+        # The rows stream from the source server straight into DuckDB
+        source = flight.connect(location)
+        try:
+            ticket = flight.Ticket(f"SELECT * FROM {table_name}".encode("utf-8"))
+            rows = self._insert_table(table_name, source.do_get(ticket).to_reader())
+        finally:
+            source.close()
+        return [flight.Result(str(rows).encode())]
+
+    def _resolve_exchanger(self, body: bytes) -> type:
+        # Registry names are sent as plain UTF-8; anything else is a pickled
+        # class. Unknown names are rejected, never imported
+        try:
+            name = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return loads(body)
+        if name not in EXCHANGER_REGISTRY:
+            raise flight.FlightServerError(f"Unknown exchanger: {name}")
+        return EXCHANGER_REGISTRY[name]
+
 
 # ------------------------------------------------------------------------------
 # Flight Server Manager
@@ -457,6 +632,15 @@ class FlightServerManager:
         self.running_servers.append((server, server_thread))
         logger.info(f"Server {config.server_id} started at {config.location}")
 
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until every started server is ready, or the timeout passes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for server, _ in self.running_servers:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not server.ready.wait(remaining):
+                return False
+        return True
+
     def shutdown_servers(self):
         logger.info("Shutting down all Flight servers...")
         self.shutdown_event.set()
@@ -494,6 +678,15 @@ class AddExchangeAction:
     name = "add_exchange"
 
 
+# ------------------------------------------------------------------------------
+# Action for Pulling a Table from Another Server
+# ------------------------------------------------------------------------------
+class PullFromAction:
+    """Body is JSON: {"location": <source server>, "table": <table name>}."""
+
+    name = "pull_from"
+
+
 # ------------------------------------------------------------------------------
 # Main Entry Point (optional)
 # ------------------------------------------------------------------------------
@@ -523,8 +716,10 @@ def main():
     manager = FlightServerManager([config])
     try:
         manager.start_servers()
-        while not manager.shutdown_event.is_set():
-            time.sleep(1)
+        # Wait in short slices so Ctrl+C is still delivered on Windows, where
+        # an untimed Event.wait() cannot be interrupted
+        while not manager.shutdown_event.wait(timeout=1.0):
+            pass
     except KeyboardInterrupt:
         logger.info("Interrupted by user")
     finally: